@@ -1,8 +1,16 @@
 import asyncio
-from fastapi import FastAPI, Depends, HTTPException, status, Query
+import os
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from anyio import from_thread
+from fastapi import FastAPI, Depends, HTTPException, status, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from sqlalchemy import delete, func, insert, inspect, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, selectinload
+from pydantic import BaseModel, ConfigDict
 from typing import List, Optional
 from datetime import datetime, timedelta
 from database import get_db, engine, Base
@@ -12,12 +20,38 @@ from auth import (
     verify_password, 
     create_access_token, 
     get_current_user,
+    CurrentUser,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
-from permissions import check_room_access, check_admin_access, check_owner_access
+from permissions import (
+    check_room_access,
+    check_admin_access,
+    check_owner_access,
+    invalidate_room_role,
+    invalidate_room
+)
 from utils import generate_room_code
 
-Base.metadata.create_all(bind=engine)
+def create_missing_indexes():
+    # create_all skips tables that already exist, so indexes added to
+    # models later have to be created separately on old databases
+    existing = {index["name"] for index in inspect(engine).get_indexes(RoomMember.__tablename__)}
+    if "ix_rm_room_user" not in existing:
+        # The old check-then-insert join could race and leave duplicate
+        # memberships, which would block the unique index; keep the oldest row
+        first_ids = select(func.min(RoomMember.id)).group_by(RoomMember.room_id, RoomMember.user_id)
+        with engine.begin() as conn:
+            conn.execute(delete(RoomMember).where(RoomMember.id.not_in(first_ids)))
+    
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_in_threadpool(Base.metadata.create_all, bind=engine)
+    await run_in_threadpool(create_missing_indexes)
+    yield
 
 tags_metadata = [
     {"name": "auth", "description": "Аутентификация и регистрация"},
@@ -34,14 +68,17 @@ app = FastAPI(
     description="Backend API для приложения совместного проживания",
     version="2.0.0",
     openapi_tags=tags_metadata,
+    lifespan=lifespan,
 )
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=[origin.strip() for origin in os.getenv("CORS_ORIGINS", "*").split(",") if origin.strip()],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "PUT", "DELETE"],
+    allow_headers=["Authorization", "Content-Type", "If-None-Match"],
+    expose_headers=["ETag"],
+    max_age=86400,
 )
 
 # Pydantic Models
@@ -67,8 +104,7 @@ class UserResponse(BaseModel):
     birth_date: str
     contact: str
     created_at: datetime
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class RoomCreate(BaseModel):
     name: str
@@ -90,8 +126,7 @@ class RoomMemberResponse(BaseModel):
     role: str
     is_banned: bool
     joined_at: datetime
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class TaskCreate(BaseModel):
     title: str
@@ -113,8 +148,7 @@ class TaskResponse(BaseModel):
     completed: bool
     created_at: datetime
     updated_at: datetime
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class ShoppingItemCreate(BaseModel):
     name: str
@@ -132,8 +166,7 @@ class ShoppingItemResponse(BaseModel):
     purchased: bool
     created_by: int
     created_at: datetime
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class CleaningScheduleCreate(BaseModel):
     user_id: int
@@ -152,8 +185,7 @@ class CleaningScheduleResponse(BaseModel):
     area: str
     created_at: datetime
     updated_at: datetime
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class MessageCreate(BaseModel):
     content: str
@@ -164,14 +196,36 @@ class MessageResponse(BaseModel):
     sender: UserResponse
     content: str
     created_at: datetime
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class Token(BaseModel):
     access_token: str
     token_type: str
     user: UserResponse
 
+# Conditional GET for room lists whose rows carry updated_at
+def list_etag(model):
+    def check_etag(
+        room_id: int,
+        request: Request,
+        response: Response,
+        current_user: CurrentUser = Depends(get_current_user),
+        db: Session = Depends(get_db)
+    ):
+        check_room_access(db, current_user.id, room_id)
+        updated_at, count = db.query(
+            func.max(model.updated_at),
+            func.count(model.id)
+        ).filter(model.room_id == room_id).one()
+        
+        etag = f'W/"{count}-{updated_at.isoformat() if updated_at else 0}"'
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in [tag.strip() for tag in if_none_match.split(",")]:
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+    
+    return check_etag
+
 # Auth Endpoints
 @app.post("/api/register", response_model=Token, tags=["auth"])
 def register(user_data: UserRegister, db: Session = Depends(get_db)):
@@ -194,7 +248,7 @@ def register(user_data: UserRegister, db: Session = Depends(get_db)):
     db.refresh(db_user)
     
     access_token = create_access_token(
-        data={"sub": db_user.username},
+        data={"sub": db_user.username, "uid": db_user.id},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
     
@@ -214,7 +268,7 @@ def login(user_data: UserLogin, db: Session = Depends(get_db)):
         )
     
     access_token = create_access_token(
-        data={"sub": user.username},
+        data={"sub": user.username, "uid": user.id},
         expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     )
     
@@ -225,27 +279,28 @@ def login(user_data: UserLogin, db: Session = Depends(get_db)):
     }
 
 @app.get("/api/me", response_model=UserResponse, tags=["auth"])
-def get_me(current_user: User = Depends(get_current_user)):
-    return current_user
+def get_me(current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    user = db.get(User, current_user.id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
 
 # Room Endpoints
 @app.post("/api/rooms", response_model=RoomResponse, tags=["rooms"], status_code=201)
 def create_room(
     room_data: RoomCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     code = generate_room_code(db)
     room = Room(name=room_data.name, code=code, created_by=current_user.id)
     db.add(room)
-    db.commit()
-    db.refresh(room)
+    db.flush()
     
     membership = RoomMember(room_id=room.id, user_id=current_user.id, role=UserRole.OWNER)
     db.add(membership)
-    db.commit()
     
-    return {
+    response = {
         "id": room.id,
         "name": room.name,
         "code": room.code,
@@ -253,59 +308,65 @@ def create_room(
         "created_at": room.created_at,
         "member_count": 1
     }
+    db.commit()
+    
+    return response
 
 @app.get("/api/rooms", response_model=List[RoomResponse], tags=["rooms"])
-def get_my_rooms(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
-    memberships = db.query(RoomMember).filter(
+def get_my_rooms(current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    my_room_ids = select(RoomMember.room_id).where(
         RoomMember.user_id == current_user.id,
         RoomMember.is_banned == False
-    ).all()
-    
-    rooms = []
-    for membership in memberships:
-        room = membership.room
-        member_count = db.query(RoomMember).filter(
-            RoomMember.room_id == room.id,
-            RoomMember.is_banned == False
-        ).count()
-        
-        rooms.append({
-            "id": room.id,
-            "name": room.name,
-            "code": room.code,
-            "created_by": room.created_by,
-            "created_at": room.created_at,
-            "member_count": member_count
-        })
-    
-    return rooms
+    )
+    rows = db.query(Room, func.count(RoomMember.id).label("member_count")).join(
+        RoomMember, RoomMember.room_id == Room.id
+    ).filter(
+        RoomMember.is_banned == False,
+        Room.id.in_(my_room_ids)
+    ).group_by(Room.id).all()
+    
+    # Rows come straight from the database, so skip re-validating them
+    return [
+        RoomResponse.model_construct(
+            id=room.id,
+            name=room.name,
+            code=room.code,
+            created_by=room.created_by,
+            created_at=room.created_at,
+            member_count=member_count
+        )
+        for room, member_count in rows
+    ]
 
 @app.post("/api/rooms/join", response_model=RoomResponse, tags=["rooms"])
-def join_room(join_data: RoomJoin, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def join_room(join_data: RoomJoin, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     room = db.query(Room).filter(Room.code == join_data.code.upper()).first()
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
     
-    existing = db.query(RoomMember).filter(
-        RoomMember.room_id == room.id,
-        RoomMember.user_id == current_user.id
-    ).first()
+    upsert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = upsert(RoomMember).values(
+        room_id=room.id,
+        user_id=current_user.id,
+        role=UserRole.MEMBER
+    ).on_conflict_do_nothing(index_elements=["room_id", "user_id"]).returning(RoomMember.id)
     
-    if existing:
-        if existing.is_banned:
+    if db.execute(stmt).first() is None:
+        is_banned = db.query(RoomMember.is_banned).filter(
+            RoomMember.room_id == room.id,
+            RoomMember.user_id == current_user.id
+        ).scalar()
+        if is_banned:
             raise HTTPException(status_code=403, detail="You are banned from this room")
         raise HTTPException(status_code=400, detail="Already a member")
     
-    membership = RoomMember(room_id=room.id, user_id=current_user.id, role=UserRole.MEMBER)
-    db.add(membership)
-    db.commit()
-    
     member_count = db.query(RoomMember).filter(
         RoomMember.room_id == room.id,
         RoomMember.is_banned == False
     ).count()
     
-    return {
+    # Build the response before commit expires the room's attributes
+    response = {
         "id": room.id,
         "name": room.name,
         "code": room.code,
@@ -313,17 +374,22 @@ def join_room(join_data: RoomJoin, current_user: User = Depends(get_current_user
         "created_at": room.created_at,
         "member_count": member_count
     }
+    db.commit()
+    invalidate_room_role(current_user.id, room.id)
+    
+    return response
 
 @app.delete("/api/rooms/{room_id}", tags=["rooms"])
-def delete_room(room_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def delete_room(room_id: int, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     check_owner_access(db, current_user.id, room_id)
     room = db.query(Room).filter(Room.id == room_id).first()
     db.delete(room)
     db.commit()
+    invalidate_room(room_id)
     return {"message": "Room deleted"}
 
 @app.post("/api/rooms/{room_id}/leave", tags=["rooms"])
-def leave_room(room_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def leave_room(room_id: int, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     membership = db.query(RoomMember).filter(
         RoomMember.room_id == room_id,
         RoomMember.user_id == current_user.id
@@ -337,27 +403,29 @@ def leave_room(room_id: int, current_user: User = Depends(get_current_user), db:
     
     db.delete(membership)
     db.commit()
+    invalidate_room_role(current_user.id, room_id)
     return {"message": "Left the room"}
 
 @app.get("/api/rooms/{room_id}/members", response_model=List[RoomMemberResponse], tags=["rooms"])
-def get_room_members(room_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_room_members(room_id: int, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     check_room_access(db, current_user.id, room_id)
-    members = db.query(RoomMember).filter(RoomMember.room_id == room_id).all()
-    
-    result = []
-    for member in members:
-        result.append({
-            "id": member.id,
-            "user": member.user,
-            "role": member.role.value,
-            "is_banned": member.is_banned,
-            "joined_at": member.joined_at
-        })
-    
-    return result
+    members = db.query(RoomMember).options(
+        selectinload(RoomMember.user)
+    ).filter(RoomMember.room_id == room_id).all()
+    
+    return [
+        RoomMemberResponse.model_construct(
+            id=member.id,
+            user=UserResponse.model_validate(member.user),
+            role=member.role.value,
+            is_banned=member.is_banned,
+            joined_at=member.joined_at
+        )
+        for member in members
+    ]
 
 @app.post("/api/rooms/{room_id}/ban/{user_id}", tags=["rooms"])
-def ban_user(room_id: int, user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def ban_user(room_id: int, user_id: int, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     check_owner_access(db, current_user.id, room_id)
     
     membership = db.query(RoomMember).filter(
@@ -373,10 +441,11 @@ def ban_user(room_id: int, user_id: int, current_user: User = Depends(get_curren
     
     membership.is_banned = True
     db.commit()
+    invalidate_room_role(user_id, room_id)
     return {"message": "User banned"}
 
 @app.post("/api/rooms/{room_id}/unban/{user_id}", tags=["rooms"])
-def unban_user(room_id: int, user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def unban_user(room_id: int, user_id: int, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     check_owner_access(db, current_user.id, room_id)
     
     membership = db.query(RoomMember).filter(
@@ -389,10 +458,11 @@ def unban_user(room_id: int, user_id: int, current_user: User = Depends(get_curr
     
     membership.is_banned = False
     db.commit()
+    invalidate_room_role(user_id, room_id)
     return {"message": "User unbanned"}
 
 @app.delete("/api/rooms/{room_id}/kick/{user_id}", tags=["rooms"])
-def kick_user(room_id: int, user_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def kick_user(room_id: int, user_id: int, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     check_owner_access(db, current_user.id, room_id)
     
     membership = db.query(RoomMember).filter(
@@ -408,14 +478,17 @@ def kick_user(room_id: int, user_id: int, current_user: User = Depends(get_curre
     
     db.delete(membership)
     db.commit()
+    invalidate_room_role(user_id, room_id)
     return {"message": "User kicked"}
 
 # Users Endpoints
 @app.get("/api/rooms/{room_id}/users", response_model=List[UserResponse], tags=["users"])
-def get_room_users(room_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_room_users(room_id: int, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     check_room_access(db, current_user.id, room_id)
     
-    members = db.query(RoomMember).filter(
+    members = db.query(RoomMember).options(
+        selectinload(RoomMember.user)
+    ).filter(
         RoomMember.room_id == room_id,
         RoomMember.is_banned == False
     ).all()
@@ -423,22 +496,24 @@ def get_room_users(room_id: int, current_user: User = Depends(get_current_user),
     return [member.user for member in members]
 
 # Tasks Endpoints
-@app.get("/api/rooms/{room_id}/tasks", response_model=List[TaskResponse], tags=["tasks"])
-def get_tasks(room_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+@app.get("/api/rooms/{room_id}/tasks", response_model=List[TaskResponse], tags=["tasks"], dependencies=[Depends(list_etag(Task))])
+def get_tasks(room_id: int, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     check_room_access(db, current_user.id, room_id)
-    return db.query(Task).filter(Task.room_id == room_id).all()
+    return db.query(Task).options(
+        selectinload(Task.assignee)
+    ).filter(Task.room_id == room_id).all()
 
 @app.post("/api/rooms/{room_id}/tasks", response_model=TaskResponse, tags=["tasks"], status_code=201)
-def create_task(room_id: int, task_data: TaskCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def create_task(room_id: int, task_data: TaskCreate, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     check_room_access(db, current_user.id, room_id)
-    task = Task(**task_data.dict(), room_id=room_id)
+    task = Task(**task_data.model_dump(), room_id=room_id)
     db.add(task)
     db.commit()
     db.refresh(task)
     return task
 
 @app.put("/api/rooms/{room_id}/tasks/{task_id}", response_model=TaskResponse, tags=["tasks"])
-def update_task(room_id: int, task_id: int, task_data: TaskUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def update_task(room_id: int, task_id: int, task_data: TaskUpdate, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     role = check_room_access(db, current_user.id, room_id)
     task = db.query(Task).filter(Task.id == task_id, Task.room_id == room_id).first()
     if not task:
@@ -447,7 +522,7 @@ def update_task(room_id: int, task_id: int, task_data: TaskUpdate, current_user:
     if role == UserRole.MEMBER and task.assignee_id != current_user.id:
         raise HTTPException(status_code=403, detail="Can only edit your own tasks")
     
-    for key, value in task_data.dict(exclude_unset=True).items():
+    for key, value in task_data.model_dump(exclude_unset=True).items():
         setattr(task, key, value)
     
     db.commit()
@@ -455,7 +530,7 @@ def update_task(room_id: int, task_id: int, task_data: TaskUpdate, current_user:
     return task
 
 @app.delete("/api/rooms/{room_id}/tasks/{task_id}", tags=["tasks"])
-def delete_task(room_id: int, task_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def delete_task(room_id: int, task_id: int, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     role = check_room_access(db, current_user.id, room_id)
     task = db.query(Task).filter(Task.id == task_id, Task.room_id == room_id).first()
     if not task:
@@ -470,27 +545,36 @@ def delete_task(room_id: int, task_id: int, current_user: User = Depends(get_cur
 
 # Shopping Endpoints
 @app.get("/api/rooms/{room_id}/shopping", response_model=List[ShoppingItemResponse], tags=["shopping"])
-def get_shopping_items(room_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_shopping_items(room_id: int, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     check_room_access(db, current_user.id, room_id)
-    return db.query(ShoppingItem).filter(ShoppingItem.room_id == room_id).all()
+    return db.execute(
+        select(
+            ShoppingItem.id,
+            ShoppingItem.name,
+            ShoppingItem.quantity,
+            ShoppingItem.purchased,
+            ShoppingItem.created_by,
+            ShoppingItem.created_at
+        ).where(ShoppingItem.room_id == room_id)
+    ).all()
 
 @app.post("/api/rooms/{room_id}/shopping", response_model=ShoppingItemResponse, tags=["shopping"], status_code=201)
-def create_shopping_item(room_id: int, item_data: ShoppingItemCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def create_shopping_item(room_id: int, item_data: ShoppingItemCreate, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     check_room_access(db, current_user.id, room_id)
-    item = ShoppingItem(**item_data.dict(), room_id=room_id, created_by=current_user.id)
+    item = ShoppingItem(**item_data.model_dump(), room_id=room_id, created_by=current_user.id)
     db.add(item)
     db.commit()
     db.refresh(item)
     return item
 
 @app.put("/api/rooms/{room_id}/shopping/{item_id}", response_model=ShoppingItemResponse, tags=["shopping"])
-def update_shopping_item(room_id: int, item_id: int, item_data: ShoppingItemUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def update_shopping_item(room_id: int, item_id: int, item_data: ShoppingItemUpdate, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     check_room_access(db, current_user.id, room_id)
     item = db.query(ShoppingItem).filter(ShoppingItem.id == item_id, ShoppingItem.room_id == room_id).first()
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     
-    for key, value in item_data.dict(exclude_unset=True).items():
+    for key, value in item_data.model_dump(exclude_unset=True).items():
         setattr(item, key, value)
     
     db.commit()
@@ -498,7 +582,7 @@ def update_shopping_item(room_id: int, item_id: int, item_data: ShoppingItemUpda
     return item
 
 @app.delete("/api/rooms/{room_id}/shopping/{item_id}", tags=["shopping"])
-def delete_shopping_item(room_id: int, item_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def delete_shopping_item(room_id: int, item_id: int, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     check_room_access(db, current_user.id, room_id)
     item = db.query(ShoppingItem).filter(ShoppingItem.id == item_id, ShoppingItem.room_id == room_id).first()
     if not item:
@@ -509,22 +593,31 @@ def delete_shopping_item(room_id: int, item_id: int, current_user: User = Depend
     return {"message": "Item deleted"}
 
 # Cleaning Endpoints
-@app.get("/api/rooms/{room_id}/cleaning", response_model=List[CleaningScheduleResponse], tags=["cleaning"])
-def get_cleaning_schedule(room_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+@app.get("/api/rooms/{room_id}/cleaning", response_model=List[CleaningScheduleResponse], tags=["cleaning"], dependencies=[Depends(list_etag(CleaningSchedule))])
+def get_cleaning_schedule(room_id: int, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     check_room_access(db, current_user.id, room_id)
-    return db.query(CleaningSchedule).filter(CleaningSchedule.room_id == room_id).all()
+    return db.execute(
+        select(
+            CleaningSchedule.id,
+            CleaningSchedule.user_id,
+            CleaningSchedule.day_of_week,
+            CleaningSchedule.area,
+            CleaningSchedule.created_at,
+            CleaningSchedule.updated_at
+        ).where(CleaningSchedule.room_id == room_id)
+    ).all()
 
 @app.post("/api/rooms/{room_id}/cleaning", response_model=CleaningScheduleResponse, tags=["cleaning"], status_code=201)
-def create_cleaning_schedule(room_id: int, schedule_data: CleaningScheduleCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def create_cleaning_schedule(room_id: int, schedule_data: CleaningScheduleCreate, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     check_room_access(db, current_user.id, room_id)
-    schedule = CleaningSchedule(**schedule_data.dict(), room_id=room_id)
+    schedule = CleaningSchedule(**schedule_data.model_dump(), room_id=room_id)
     db.add(schedule)
     db.commit()
     db.refresh(schedule)
     return schedule
 
 @app.put("/api/rooms/{room_id}/cleaning/{schedule_id}", response_model=CleaningScheduleResponse, tags=["cleaning"])
-def update_cleaning_schedule(room_id: int, schedule_id: int, schedule_data: CleaningScheduleUpdate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def update_cleaning_schedule(room_id: int, schedule_id: int, schedule_data: CleaningScheduleUpdate, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     check_room_access(db, current_user.id, room_id)
     schedule = db.query(CleaningSchedule).filter(
         CleaningSchedule.id == schedule_id,
@@ -533,7 +626,7 @@ def update_cleaning_schedule(room_id: int, schedule_id: int, schedule_data: Clea
     if not schedule:
         raise HTTPException(status_code=404, detail="Schedule not found")
     
-    for key, value in schedule_data.dict(exclude_unset=True).items():
+    for key, value in schedule_data.model_dump(exclude_unset=True).items():
         setattr(schedule, key, value)
     
     db.commit()
@@ -541,7 +634,7 @@ def update_cleaning_schedule(room_id: int, schedule_id: int, schedule_data: Clea
     return schedule
 
 @app.delete("/api/rooms/{room_id}/cleaning/{schedule_id}", tags=["cleaning"])
-def delete_cleaning_schedule(room_id: int, schedule_id: int, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def delete_cleaning_schedule(room_id: int, schedule_id: int, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     check_room_access(db, current_user.id, room_id)
     schedule = db.query(CleaningSchedule).filter(
         CleaningSchedule.id == schedule_id,
@@ -555,51 +648,87 @@ def delete_cleaning_schedule(room_id: int, schedule_id: int, current_user: User
     return {"message": "Schedule deleted"}
 
 # Messages Endpoints
+# Long polling: one event per room, set and replaced on every new message.
+# Events live in this process only, so the app must run as a single worker.
+room_events: dict[int, asyncio.Event] = defaultdict(asyncio.Event)
+
+def notify_room(room_id: int):
+    event = room_events.pop(room_id, None)
+    if event is not None:
+        event.set()
+
+def get_new_messages(db: Session, room_id: int, last_message_id: int):
+    query = db.query(Message).options(
+        selectinload(Message.sender)
+    ).filter(Message.room_id == room_id)
+    if last_message_id > 0:
+        query = query.filter(Message.id > last_message_id)
+    return query.order_by(Message.id.asc()).all()
+
 @app.get("/api/rooms/{room_id}/messages", response_model=List[MessageResponse], tags=["messages"])
-def get_messages(room_id: int, limit: int = 100, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_messages(room_id: int, limit: int = 100, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     check_room_access(db, current_user.id, room_id)
-    messages = db.query(Message).filter(
+    messages = db.query(Message).options(
+        selectinload(Message.sender)
+    ).filter(
         Message.room_id == room_id
-    ).order_by(Message.created_at.desc()).limit(limit).all()
+    ).order_by(Message.id.desc()).limit(limit).all()
     return messages[::-1]
 
 @app.post("/api/rooms/{room_id}/messages", response_model=MessageResponse, tags=["messages"], status_code=201)
-def create_message(room_id: int, message_data: MessageCreate, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def create_message(room_id: int, message_data: MessageCreate, current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
     check_room_access(db, current_user.id, room_id)
     message = Message(room_id=room_id, sender_id=current_user.id, content=message_data.content)
     db.add(message)
     db.commit()
     db.refresh(message)
+    from_thread.run_sync(notify_room, room_id)
     return message
 
+@app.post("/api/rooms/{room_id}/messages/bulk", response_model=List[MessageResponse], tags=["messages"], status_code=201)
+def create_messages_bulk(room_id: int, messages_data: List[MessageCreate], current_user: CurrentUser = Depends(get_current_user), db: Session = Depends(get_db)):
+    check_room_access(db, current_user.id, room_id)
+    if not messages_data:
+        return []
+    
+    messages = db.scalars(
+        insert(Message).returning(Message, sort_by_parameter_order=True),
+        [
+            {"room_id": room_id, "sender_id": current_user.id, "content": message_data.content}
+            for message_data in messages_data
+        ]
+    ).all()
+    # Validate before commit expires the rows; the sender is loaded once and shared
+    response = [MessageResponse.model_validate(message) for message in messages]
+    db.commit()
+    from_thread.run_sync(notify_room, room_id)
+    return response
+
 @app.get("/api/rooms/{room_id}/messages/poll", response_model=List[MessageResponse], tags=["messages"])
 async def poll_messages(
     room_id: int,
     last_message_id: int = Query(0, description="ID последнего полученного сообщения"),
     timeout: int = Query(25, description="Таймаут ожидания в секундах"),
-    current_user: User = Depends(get_current_user),
+    current_user: CurrentUser = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    check_room_access(db, current_user.id, room_id)
+    await run_in_threadpool(check_room_access, db, current_user.id, room_id)
     timeout = min(timeout, 30)
-    start_time = asyncio.get_event_loop().time()
+    # Take the event before querying so a message committed in between still wakes us
+    event = room_events[room_id]
     
-    while True:
-        query = db.query(Message).filter(Message.room_id == room_id)
-        if last_message_id > 0:
-            query = query.filter(Message.id > last_message_id)
-        
-        new_messages = query.order_by(Message.created_at.asc()).all()
-        
-        if new_messages:
-            return new_messages
-        
-        elapsed = asyncio.get_event_loop().time() - start_time
-        if elapsed >= timeout:
-            return []
-        
-        await asyncio.sleep(0.5)
-        db.expire_all()
+    new_messages = await run_in_threadpool(get_new_messages, db, room_id, last_message_id)
+    if new_messages:
+        return new_messages
+    
+    # Give the connection back to the pool while we wait
+    await run_in_threadpool(db.close)
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+    except asyncio.TimeoutError:
+        return []
+    
+    return await run_in_threadpool(get_new_messages, db, room_id, last_message_id)
 
 if __name__ == "__main__":
     import uvicorn
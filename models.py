@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Text, Enum, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
@@ -27,6 +27,10 @@ class Room(Base):
 
 class RoomMember(Base):
     __tablename__ = "room_members"
+    __table_args__ = (
+        Index("ix_rm_room_user", "room_id", "user_id", unique=True),
+        Index("ix_rm_room_notbanned", "room_id", "is_banned"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     room_id = Column(Integer, ForeignKey("rooms.id"))
@@ -58,6 +62,7 @@ class User(Base):
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (Index("ix_task_room", "room_id"),)
     
     id = Column(Integer, primary_key=True, index=True)
     room_id = Column(Integer, ForeignKey("rooms.id"))
@@ -73,6 +78,7 @@ class Task(Base):
 
 class ShoppingItem(Base):
     __tablename__ = "shopping_items"
+    __table_args__ = (Index("ix_shopping_room", "room_id"),)
     
     id = Column(Integer, primary_key=True, index=True)
     room_id = Column(Integer, ForeignKey("rooms.id"))
@@ -86,6 +92,7 @@ class ShoppingItem(Base):
 
 class CleaningSchedule(Base):
     __tablename__ = "cleaning_schedule"
+    __table_args__ = (Index("ix_cleaning_room", "room_id"),)
     
     id = Column(Integer, primary_key=True, index=True)
     room_id = Column(Integer, ForeignKey("rooms.id"))
@@ -99,6 +106,7 @@ class CleaningSchedule(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (Index("ix_msg_room_id", "room_id", "id"),)
     
     id = Column(Integer, primary_key=True, index=True)
     room_id = Column(Integer, ForeignKey("rooms.id"))
@@ -1,23 +1,49 @@
+from threading import Lock
+from cachetools import TTLCache
 from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
 from models import Room, RoomMember, User, UserRole
 
+# (user_id, room_id) -> (role, is_banned), only for existing memberships.
+# Endpoints that change a membership must invalidate it after commit.
+_role_cache = TTLCache(maxsize=100_000, ttl=30)
+_role_cache_lock = Lock()
+
+def invalidate_room_role(user_id: int, room_id: int):
+    with _role_cache_lock:
+        _role_cache.pop((user_id, room_id), None)
+
+def invalidate_room(room_id: int):
+    with _role_cache_lock:
+        for key in [key for key in _role_cache if key[1] == room_id]:
+            _role_cache.pop(key, None)
+
 def get_user_room_role(db: Session, user_id: int, room_id: int) -> UserRole | None:
-    membership = db.query(RoomMember).filter(
-        RoomMember.user_id == user_id,
-        RoomMember.room_id == room_id
-    ).first()
+    key = (user_id, room_id)
+    with _role_cache_lock:
+        cached = _role_cache.get(key)
     
-    if not membership:
-        return None
+    if cached is None:
+        membership = db.query(RoomMember).filter(
+            RoomMember.user_id == user_id,
+            RoomMember.room_id == room_id
+        ).first()
+        
+        if not membership:
+            return None
+        
+        cached = (membership.role, membership.is_banned)
+        with _role_cache_lock:
+            _role_cache[key] = cached
     
-    if membership.is_banned:
+    role, is_banned = cached
+    if is_banned:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You are banned from this room"
         )
     
-    return membership.role
+    return role
 
 def check_room_access(db: Session, user_id: int, room_id: int):
     role = get_user_room_role(db, user_id, room_id)
@@ -1,11 +1,20 @@
-import random
+import secrets
 import string
 from sqlalchemy.orm import Session
 from models import Room
 
-def generate_room_code(db: Session, length: int = 6) -> str:
+ALPHABET = string.ascii_uppercase + string.digits
+
+# Random byte -> code character. Bytes past the last full multiple of
+# len(ALPHABET) are dropped so every character is equally likely.
+_CODE_TABLE = bytes(ord(ALPHABET[b % len(ALPHABET)]) for b in range(256))
+_DROPPED_BYTES = bytes(range(256 - 256 % len(ALPHABET), 256))
+
+def generate_room_code(db: Session, length: int = 6, batch: int = 8) -> str:
     while True:
-        code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
-        existing = db.query(Room).filter(Room.code == code).first()
-        if not existing:
-            return code
\ No newline at end of file
+        chars = secrets.token_bytes(length * batch).translate(_CODE_TABLE, _DROPPED_BYTES).decode()
+        candidates = {chars[i:i + length] for i in range(0, len(chars) - length + 1, length)}
+        taken = {code for code, in db.query(Room.code).filter(Room.code.in_(candidates)).all()}
+        free = candidates - taken
+        if free:
+            return free.pop()
\ No newline at end of file